@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Catalog benchmark - insert and query throughput of the SQLite/FTS5 book catalog.
+Usage: python src/benchmark_catalog.py [number_of_books]
+"""
+
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from main import open_catalog, search_catalog, upsert_books
+
+WORDS = ['krim', 'mord', 'kjærlighet', 'roman', 'historie', 'familie', 'hemmelighet', 'detektiv',
+         'krig', 'sommer', 'natt', 'byen', 'fjellet', 'havet', 'brev', 'reise', 'thriller', 'skjebne']
+BATCH_SIZE = 1000
+
+
+def make_book(i, rng):
+    """Build a synthetic book_data dict"""
+    return {
+        'ean': f"978{i:010d}",
+        'url': f"https://www.norli.no/boker/bok-{i}-978{i:010d}",
+        'source': 'norli',
+        'title': ' '.join(rng.choices(WORDS, k=3)).capitalize(),
+        'author': f"Forfatter {i % 5000}",
+        'year': str(rng.randint(2015, 2025)),
+        'language': 'Norwegian',
+        'description': ' '.join(rng.choices(WORDS, k=rng.randint(10, 120))),
+        'reviews': ' '.join(rng.choices(WORDS, k=rng.randint(0, 40))),
+        'image_url': ''
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = open_catalog(Path(tmp) / "catalog.db")
+
+        books = [make_book(i, rng) for i in range(count)]
+        start = time.perf_counter()
+        for i in range(0, count, BATCH_SIZE):
+            upsert_books(conn, books[i:i + BATCH_SIZE])
+        elapsed = time.perf_counter() - start
+        print(f"Insert: {count} books in {elapsed:.2f}s ({count / elapsed:,.0f} books/s)")
+
+        # Re-upsert a slice to measure incremental updates by EAN
+        updates = [dict(book, description=book['description'] + ' oppdatert') for book in books[:BATCH_SIZE * 10]]
+        start = time.perf_counter()
+        for i in range(0, len(updates), BATCH_SIZE):
+            upsert_books(conn, updates[i:i + BATCH_SIZE])
+        elapsed = time.perf_counter() - start
+        print(f"Update: {len(updates)} books in {elapsed:.2f}s ({len(updates) / elapsed:,.0f} books/s)")
+
+        queries = [
+            ("unreviewed crime, description > 300 chars",
+             dict(query='krim OR thriller OR detektiv', reviewed=False, min_description_length=300, limit=50)),
+            ("unreviewed crime, description > 300 chars, ranked",
+             dict(query='krim OR thriller OR detektiv', reviewed=False, min_description_length=300, limit=50,
+                  ranked=True)),
+            ("phrase in title/description", dict(query='"mord natt"', limit=50)),
+            ("author lookup", dict(query='author:"Forfatter 42"')),
+            ("unreviewed, no text query", dict(reviewed=False, limit=50)),
+        ]
+        for name, kwargs in queries:
+            runs = 20
+            start = time.perf_counter()
+            for _ in range(runs):
+                results = search_catalog(conn, **kwargs)
+            elapsed = (time.perf_counter() - start) / runs
+            print(f"Query '{name}': {len(results)} results, {elapsed * 1000:.2f} ms")
+
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,24 @@ Norli Book Daddy Bot - Flirty Book Reviews for Bluesky
 Scrapes Norli.no for new books, generates sexy book reviews using GPT-4o, and posts to Bluesky.
 """
 
+import argparse
+import cProfile
+import hashlib
+import io
 import json
 import logging
 import os
+import pstats
 import random
+import re
+import sqlite3
+import sys
+import threading
 import time
-from datetime import datetime, timezone
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import requests
@@ -38,9 +50,45 @@ BSKY_PASSWORD = os.getenv("BSKY_PASSWORD")
 # URLs
 NORLI_NEW_BOOKS_URL = "https://www.norli.no/boker/aktuelt-og-anbefalt/manedens-nyheter"
 
+# Shared page fetching
+FETCH_MAX_TABS = 4  # Tabs per wave sharing one render wait in the shared browser
+REPLAY_DIR = None  # Serve pages from saved HTML files instead of the browser (--replay)
+RECORD_DIR = None  # Save every fetched page as HTML for later replay (--record)
+BROWSER = {"driver": None}  # Browser shared by every fetch_pages() call in a run
+
 # State management
 STATE_FILE = Path("book_state.json")
 
+# Book catalog (SQLite with FTS5 full-text index)
+CATALOG_FILE = STATE_FILE.with_name("catalog.db")
+DETAIL_RETRY_DAYS = 7  # Days before a book whose detail scrape failed is picked again
+MAX_DETAIL_ATTEMPTS = 3  # Books tried per run before giving up on detail scraping
+CATALOG_FIELDS = ['ean', 'url', 'source', 'title', 'author', 'year', 'language', 'description', 'reviews', 'image_url']
+
+# Near-duplicate review detection (MinHash/LSH over posted reviews)
+REVIEW_INDEX_FILE = STATE_FILE.with_name("review_index.json")
+MINHASH_BINS = 64  # Signature length (one-permutation MinHash, one bin per signature slot)
+LSH_BANDS = 32  # 32 bands x 2 rows: knee near (1/32)^(1/2) ~ 0.18, ~95% of pairs at the threshold become candidates
+SHINGLE_SIZE = 3  # Words per shingle
+REVIEW_INDEX_SCHEME = "oph-blake2b-3"  # Stored signatures are only comparable when this matches
+# Estimated Jaccard similarity of word-trigram sets that triggers regeneration. Two fresh reviews
+# of different books share well under 10% of their trigrams; 0.3 means roughly a third of the
+# review is recycled phrasing (reused opener and closer plus a few stock sentences). A single
+# shared phrase alone stays below it, so the bot is not stuck regenerating over common idioms.
+REVIEW_SIMILARITY_THRESHOLD = 0.3
+MAX_REVIEW_ATTEMPTS = 3
+
+# Engagement ingestion
+ENGAGEMENT_FILE = STATE_FILE.with_name("engagement.json")
+GET_POSTS_BATCH_SIZE = 25  # app.bsky.feed.getPosts accepts at most 25 URIs per call
+ENGAGEMENT_MAX_CONCURRENCY = 4
+
+# Profiling (--profile)
+PROFILE_DIR = Path("profile")
+PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples for the flame graph
+PROFILE_REPLAY_MIN_SECONDS = 5.0  # Replayed stages are repeated for at least this long in the sampling pass
+MEMORY_SNAPSHOTS = []  # (stage, snapshot before, snapshot after, peak bytes) collected while tracemalloc is tracing
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
@@ -59,76 +107,329 @@ def get_selenium_driver():
     return driver
 
 
-def scrape_book_list():
-    """Scrape the list of new books from Norli.no using Selenium (JavaScript rendering)"""
-    logging.info(f"Fetching book list from {NORLI_NEW_BOOKS_URL}")
-    
-    driver = None
+def get_shared_driver():
+    """Return the browser shared by all page fetches in this run, starting it on first use"""
+    if BROWSER["driver"] is None:
+        BROWSER["driver"] = get_selenium_driver()
+    return BROWSER["driver"]
+
+
+def close_shared_driver():
+    """Quit the shared browser, if one was started"""
+    driver, BROWSER["driver"] = BROWSER["driver"], None
+    if driver:
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning(f"Could not quit browser: {e}")
+
+
+def page_file(directory, url):
+    """Path of the saved HTML for a URL in a record/replay directory"""
+    return Path(directory) / (re.sub(r'[^A-Za-z0-9]+', '_', url).strip('_') + '.html')
+
+
+def fetch_pages(urls):
+    """Load pages in the run's shared browser, one tab per URL, and return {url: BeautifulSoup}.
+
+    Pages are loaded one after another, but each wave of tabs shares a single JavaScript
+    render wait instead of paying it once per page."""
+    pages = {}
+    urls = list(dict.fromkeys(urls))  # Deduplicate, keeping order
+    if not urls:
+        return pages
+
+    if REPLAY_DIR:
+        for url in urls:
+            path = page_file(REPLAY_DIR, url)
+            if path.exists():
+                with memory_stage(f"parse {url}"):
+                    pages[url] = BeautifulSoup(path.read_text(encoding='utf-8'), 'html.parser')
+            else:
+                logging.warning(f"No replayed page for {url} ({path})")
+        return pages
+
     try:
-        driver = get_selenium_driver()
-        driver.get(NORLI_NEW_BOOKS_URL)
-        
-        # Wait for content to load (adjust selector as needed)
-        time.sleep(5)  # Give React time to render
-        
-        # Get page source after JavaScript execution
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        
-        # Find all book links
-        book_links = []
-        
-        # Try multiple possible selectors
-        for selector in [
-            'a[href*="/boker/"]',
-            '.product-item a',
-            '.book-item a',
-            'article a[href*="/boker/"]',
-            '[data-testid*="product"] a',
-            '.ProductItem a'
-        ]:
-            elements = soup.select(selector)
-            if elements:
-                for link in elements:
-                    href = link.get('href')
-                    if href and '/boker/' in href and '-978' in href:  # ISBN pattern
-                        # Make absolute URL
-                        if href.startswith('/'):
-                            href = f"https://www.norli.no{href}"
-                        if href not in book_links:
-                            book_links.append(href)
-        
-        # Remove duplicates
-        book_links = list(set(book_links))
-        
-        logging.info(f"Found {len(book_links)} book URLs")
-        return book_links
-        
+        driver = get_shared_driver()
+        for i in range(0, len(urls), FETCH_MAX_TABS):
+            wave = urls[i:i + FETCH_MAX_TABS]
+            handles = {}
+            for j, url in enumerate(wave):
+                try:
+                    if j > 0:
+                        driver.switch_to.new_window('tab')
+                    handle = driver.current_window_handle
+                    driver.get(url)
+                    handles[url] = handle
+                except Exception as e:
+                    logging.error(f"Error loading {url}: {e}")
+
+            time.sleep(5)  # Give React time to render
+
+            for url, handle in handles.items():
+                try:
+                    driver.switch_to.window(handle)
+                    html = driver.page_source
+                    if RECORD_DIR:
+                        page_file(RECORD_DIR, url).write_text(html, encoding='utf-8')
+                    with memory_stage(f"parse {url}"):
+                        pages[url] = BeautifulSoup(html, 'html.parser')
+                except Exception as e:
+                    logging.error(f"Error reading {url}: {e}")
+
+            # Close every tab except the first before the next wave, including tabs whose load failed
+            for handle in driver.window_handles[1:]:
+                try:
+                    driver.switch_to.window(handle)
+                    driver.close()
+                except Exception as e:
+                    logging.warning(f"Could not close tab: {e}")
+            driver.switch_to.window(driver.window_handles[0])
     except Exception as e:
-        logging.error(f"Error scraping book list: {e}")
-        return []
-    finally:
-        if driver:
-            driver.quit()
+        logging.error(f"Error fetching pages: {e}")
+        close_shared_driver()  # Start a fresh browser on the next fetch
+    return pages
 
 
-def scrape_book_details(book_url):
-    """Scrape detailed information about a specific book using Selenium"""
-    logging.info(f"Scraping book details from {book_url}")
+def norli_extract_ean(url):
+    """Extract the EAN from a Norli product URL (pattern: -9788202806453)"""
+    ean_match = re.search(r'-(978\d{10})(?:\?|$)', url)
+    return ean_match.group(1) if ean_match else ''
+
+
+def norli_extract_book_links(soup):
+    """Extract product URLs from a Norli listing page"""
+    book_links = []
+
+    # Try multiple possible selectors
+    for selector in [
+        'a[href*="/boker/"]',
+        '.product-item a',
+        '.book-item a',
+        'article a[href*="/boker/"]',
+        '[data-testid*="product"] a',
+        '.ProductItem a'
+    ]:
+        elements = soup.select(selector)
+        if elements:
+            for link in elements:
+                href = link.get('href')
+                if href and '/boker/' in href and '-978' in href:  # ISBN pattern
+                    # Make absolute URL
+                    if href.startswith('/'):
+                        href = f"https://www.norli.no{href}"
+                    if href not in book_links:
+                        book_links.append(href)
+    return book_links
+
+
+def norli_extract_book_details(soup, book_data):
+    """Fill book_data from a Norli product page (adjust selectors based on actual Norli HTML)"""
+    # Try to extract title
+    title_selectors = ['h1', '.product-title', '.book-title', 'h1.title', '[data-testid="product-title"]']
+    for selector in title_selectors:
+        element = soup.select_one(selector)
+        if element:
+            book_data['title'] = element.get_text(strip=True)
+            if book_data['title']:
+                break
+    
+    # Try to extract author
+    author_selectors = [
+        '.productFullDetailNorli-authors-cdP a',  # Norli specific
+        '.productFullDetailNorli-authors-cdP',    # Norli specific fallback
+        'a[href*="/forfatter/"]', 
+        '.author', 
+        '.product-author', 
+        'span[itemprop="author"]', 
+        '[data-testid="author"]'
+    ]
+    for selector in author_selectors:
+        element = soup.select_one(selector)
+        if element:
+            book_data['author'] = element.get_text(strip=True)
+            if book_data['author']:
+                break
+    
+    # Try to extract publication year
+    year_selectors = ['.publication-year', '.year', 'span[itemprop="datePublished"]', '[data-testid="year"]']
+    for selector in year_selectors:
+        element = soup.select_one(selector)
+        if element:
+            text = element.get_text(strip=True)
+            # Extract 4-digit year
+            year_match = re.search(r'\b(20\d{2}|19\d{2})\b', text)
+            if year_match:
+                book_data['year'] = year_match.group(1)
+                break
+    
+    # If no year found, try searching all text
+    if not book_data['year']:
+        text = soup.get_text()
+        year_match = re.search(r'\b(202[0-9]|201[0-9])\b', text)
+        if year_match:
+            book_data['year'] = year_match.group(1)
+    
+    # Try to extract language
+    language_selectors = ['.language', 'span[itemprop="inLanguage"]', '[data-testid="language"]']
+    for selector in language_selectors:
+        element = soup.select_one(selector)
+        if element:
+            book_data['language'] = element.get_text(strip=True)
+            if book_data['language']:
+                break
+    
+    # Default language if not found
+    if not book_data['language']:
+        book_data['language'] = 'Norwegian'
     
-    driver = None
+    # Try to extract description
+    desc_selectors = [
+        'section[class*="descriptionWrapper"] div[class*="richText"]',  # Norli specific
+        '.richText-root-SHY',  # Norli specific
+        'section[class*="descriptionWrapper"]',  # Norli specific
+        '.description', 
+        '.product-description', 
+        '[itemprop="description"]', 
+        '.book-description', 
+        '[data-testid="description"]'
+    ]
+    for selector in desc_selectors:
+        element = soup.select_one(selector)
+        if element:
+            # Get text from all <p> tags if they exist, otherwise get all text
+            paragraphs = element.find_all('p')
+            if paragraphs:
+                book_data['description'] = ' '.join([p.get_text(strip=True) for p in paragraphs])
+            else:
+                book_data['description'] = element.get_text(strip=True)
+            
+            if len(book_data['description']) > 50:  # Make sure it's substantial
+                break
+    
+    # Try to extract customer reviews
+    # Look for review sections
+    review_keywords = ['anmeldelse', 'reviews', 'omtale']
+    for keyword in review_keywords:
+        review_sections = soup.find_all(['div', 'section'], string=lambda t: t and keyword.lower() in t.lower())
+        if review_sections:
+            for section in review_sections:
+                parent = section.find_parent(['div', 'section'])
+                if parent:
+                    reviews_text = parent.get_text(separator='\n', strip=True)
+                    if len(reviews_text) > 100:  # Has substantial content
+                        book_data['reviews'] = reviews_text
+                        break
+            if book_data['reviews']:
+                break
+    
+    # Also try direct review selectors
+    if not book_data['reviews']:
+        review_selectors = ['.reviews', '.customer-reviews', '.anmeldelser', '#reviews', '[data-testid="reviews"]']
+        for selector in review_selectors:
+            element = soup.select_one(selector)
+            if element:
+                book_data['reviews'] = element.get_text(separator='\n', strip=True)
+                if len(book_data['reviews']) > 50:
+                    break
+    
+    # Try to extract book cover image
+    image_selectors = [
+        '.carouselGallery-image-gHz[alt="image-product"]',  # Norli specific
+        'img[alt="image-product"]',
+        '.product-image img',
+        '[itemprop="image"]',
+        '.book-cover img'
+    ]
+    for selector in image_selectors:
+        img_elements = soup.select(selector)
+        for img in img_elements:
+            src = img.get('src', '')
+            # Look for the large image, not the placeholder or preview
+            if src and '/media/catalog/product/' in src and 'width=728' in src:
+                # Make absolute URL if needed
+                if src.startswith('/'):
+                    book_data['image_url'] = f"https://www.norli.no{src}"
+                else:
+                    book_data['image_url'] = src
+                break
+        if book_data['image_url']:
+            break
+
+
+# Source adapters: one dict per retailer with its listing pages and parsing functions.
+# To add a store, write its three extract functions and append an adapter here.
+NORLI_ADAPTER = {
+    'name': 'norli',
+    'list_urls': [NORLI_NEW_BOOKS_URL],
+    'extract_book_links': norli_extract_book_links,
+    'extract_book_details': norli_extract_book_details,
+    'extract_ean': norli_extract_ean,
+}
+
+SOURCE_ADAPTERS = [NORLI_ADAPTER]
+
+
+def scrape_book_list(adapters=None):
+    """Discover candidate books from all source adapters, merged and deduplicated by EAN.
+
+    All listing pages are fetched together through fetch_pages(). Returns a list of
+    {'url', 'ean', 'source'} dicts; books without an EAN are kept as-is."""
+    adapters = adapters or SOURCE_ADAPTERS
+    list_urls = [url for adapter in adapters for url in adapter['list_urls']]
+    logging.info(f"Fetching book lists from {len(list_urls)} pages across {len(adapters)} sources")
+
+    pages = fetch_pages(list_urls)
+
+    candidates = []
+    seen = set()
+    for adapter in adapters:
+        found = 0
+        for list_url in adapter['list_urls']:
+            soup = pages.get(list_url)
+            if soup is None:
+                continue
+            try:
+                links = adapter['extract_book_links'](soup)
+            except Exception as e:
+                logging.error(f"Error extracting book links from {list_url}: {e}")
+                continue
+            for url in links:
+                ean = adapter['extract_ean'](url)
+                key = ean or url
+                if key in seen:
+                    continue
+                seen.add(key)
+                candidates.append({'url': url, 'ean': ean, 'source': adapter['name']})
+                found += 1
+        logging.info(f"Found {found} book URLs from {adapter['name']}")
+
+    logging.info(f"Found {len(candidates)} unique books")
+    return candidates
+
+
+def get_adapter(name):
+    """Look up a source adapter by name"""
+    for adapter in SOURCE_ADAPTERS:
+        if adapter['name'] == name:
+            return adapter
+    raise ValueError(f"Unknown book source: {name}")
+
+
+def scrape_book_details(book_url, source='norli'):
+    """Scrape detailed information about a specific book using its source adapter"""
+    logging.info(f"Scraping book details from {book_url}")
+
+    adapter = get_adapter(source)
+    soup = fetch_pages([book_url]).get(book_url)
+    if soup is None:
+        return None
+
     try:
-        driver = get_selenium_driver()
-        driver.get(book_url)
-        
-        # Wait for content to load
-        time.sleep(5)  # Give React time to render
-        
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        
-        # Extract book information (adjust selectors based on actual Norli HTML)
         book_data = {
             'url': book_url,
-            'ean': '',
+            'source': source,
+            'ean': adapter['extract_ean'](book_url),
             'title': '',
             'author': '',
             'year': '',
@@ -137,159 +438,19 @@ def scrape_book_details(book_url):
             'reviews': '',
             'image_url': ''
         }
-        
-        # Extract EAN from URL (pattern: -9788202806453)
-        import re
-        ean_match = re.search(r'-(978\d{10})(?:\?|$)', book_url)
-        if ean_match:
-            book_data['ean'] = ean_match.group(1)
-        else:
+        if not book_data['ean']:
             logging.warning(f"Could not extract EAN from URL: {book_url}")
-        
-        # Try to extract title
-        title_selectors = ['h1', '.product-title', '.book-title', 'h1.title', '[data-testid="product-title"]']
-        for selector in title_selectors:
-            element = soup.select_one(selector)
-            if element:
-                book_data['title'] = element.get_text(strip=True)
-                if book_data['title']:
-                    break
-        
-        # Try to extract author
-        author_selectors = [
-            '.productFullDetailNorli-authors-cdP a',  # Norli specific
-            '.productFullDetailNorli-authors-cdP',    # Norli specific fallback
-            'a[href*="/forfatter/"]', 
-            '.author', 
-            '.product-author', 
-            'span[itemprop="author"]', 
-            '[data-testid="author"]'
-        ]
-        for selector in author_selectors:
-            element = soup.select_one(selector)
-            if element:
-                book_data['author'] = element.get_text(strip=True)
-                if book_data['author']:
-                    break
-        
-        # Try to extract publication year
-        year_selectors = ['.publication-year', '.year', 'span[itemprop="datePublished"]', '[data-testid="year"]']
-        for selector in year_selectors:
-            element = soup.select_one(selector)
-            if element:
-                text = element.get_text(strip=True)
-                # Extract 4-digit year
-                import re
-                year_match = re.search(r'\b(20\d{2}|19\d{2})\b', text)
-                if year_match:
-                    book_data['year'] = year_match.group(1)
-                    break
-        
-        # If no year found, try searching all text
-        if not book_data['year']:
-            import re
-            text = soup.get_text()
-            year_match = re.search(r'\b(202[0-9]|201[0-9])\b', text)
-            if year_match:
-                book_data['year'] = year_match.group(1)
-        
-        # Try to extract language
-        language_selectors = ['.language', 'span[itemprop="inLanguage"]', '[data-testid="language"]']
-        for selector in language_selectors:
-            element = soup.select_one(selector)
-            if element:
-                book_data['language'] = element.get_text(strip=True)
-                if book_data['language']:
-                    break
-        
-        # Default language if not found
-        if not book_data['language']:
-            book_data['language'] = 'Norwegian'
-        
-        # Try to extract description
-        desc_selectors = [
-            'section[class*="descriptionWrapper"] div[class*="richText"]',  # Norli specific
-            '.richText-root-SHY',  # Norli specific
-            'section[class*="descriptionWrapper"]',  # Norli specific
-            '.description', 
-            '.product-description', 
-            '[itemprop="description"]', 
-            '.book-description', 
-            '[data-testid="description"]'
-        ]
-        for selector in desc_selectors:
-            element = soup.select_one(selector)
-            if element:
-                # Get text from all <p> tags if they exist, otherwise get all text
-                paragraphs = element.find_all('p')
-                if paragraphs:
-                    book_data['description'] = ' '.join([p.get_text(strip=True) for p in paragraphs])
-                else:
-                    book_data['description'] = element.get_text(strip=True)
-                
-                if len(book_data['description']) > 50:  # Make sure it's substantial
-                    break
-        
-        # Try to extract customer reviews
-        # Look for review sections
-        review_keywords = ['anmeldelse', 'reviews', 'omtale']
-        for keyword in review_keywords:
-            review_sections = soup.find_all(['div', 'section'], string=lambda t: t and keyword.lower() in t.lower())
-            if review_sections:
-                for section in review_sections:
-                    parent = section.find_parent(['div', 'section'])
-                    if parent:
-                        reviews_text = parent.get_text(separator='\n', strip=True)
-                        if len(reviews_text) > 100:  # Has substantial content
-                            book_data['reviews'] = reviews_text
-                            break
-                if book_data['reviews']:
-                    break
-        
-        # Also try direct review selectors
-        if not book_data['reviews']:
-            review_selectors = ['.reviews', '.customer-reviews', '.anmeldelser', '#reviews', '[data-testid="reviews"]']
-            for selector in review_selectors:
-                element = soup.select_one(selector)
-                if element:
-                    book_data['reviews'] = element.get_text(separator='\n', strip=True)
-                    if len(book_data['reviews']) > 50:
-                        break
-        
-        # Try to extract book cover image
-        image_selectors = [
-            '.carouselGallery-image-gHz[alt="image-product"]',  # Norli specific
-            'img[alt="image-product"]',
-            '.product-image img',
-            '[itemprop="image"]',
-            '.book-cover img'
-        ]
-        for selector in image_selectors:
-            img_elements = soup.select(selector)
-            for img in img_elements:
-                src = img.get('src', '')
-                # Look for the large image, not the placeholder or preview
-                if src and '/media/catalog/product/' in src and 'width=728' in src:
-                    # Make absolute URL if needed
-                    if src.startswith('/'):
-                        book_data['image_url'] = f"https://www.norli.no{src}"
-                    else:
-                        book_data['image_url'] = src
-                    break
-            if book_data['image_url']:
-                break
-        
+
+        adapter['extract_book_details'](soup, book_data)
+
         logging.info(f"Extracted book: {book_data['title']} by {book_data['author']}")
         if book_data['image_url']:
             logging.info(f"Found book cover image: {book_data['image_url']}")
         return book_data
-        
+
     except Exception as e:
         logging.error(f"Error scraping book details: {e}")
         return None
-    finally:
-        if driver:
-            driver.quit()
 
 
 def generate_book_review(book_data):
@@ -375,207 +536,215 @@ Write 2-3 engaging paragraphs that flow naturally. Focus on why this book is irr
         return None
 
 
-def post_to_bluesky(review_text, book_data=None):
-    """Post the book review to Bluesky as a thread (max 3 posts) with book cover and link. Returns post URL or None."""
-    if not BSKY_HANDLE or not BSKY_PASSWORD:
-        logging.error("Bluesky credentials not defined")
-        return None
+def build_thread_chunks(review_text, book_data=None):
+    """Split a review into the texts of a Bluesky thread (max 3 posts, book link in the last one)"""
+    max_length = 290  # Leave some margin
+    max_posts = 3
     
-    try:
-        client = Client()
-        client.login(BSKY_HANDLE.strip(), BSKY_PASSWORD.strip())
-        
-        max_length = 290  # Leave some margin
-        max_posts = 3
-        
-        # Split review into chunks for thread (max 3 posts)
-        # Strategy: Split by sentences (periods), keep continuing naturally without truncation
-        
-        # Split into sentences
-        sentences = []
-        for sentence in review_text.split('. '):
-            s = sentence.strip()
-            if s:
-                # Add period back unless it's the last sentence
-                if not s.endswith(('.', '!', '?')):
-                    s += '.'
-                sentences.append(s)
-        
-        # Build posts by adding sentences until we hit the limit
-        chunks = []
-        current_chunk = ""
+    # Split review into chunks for thread (max 3 posts)
+    # Strategy: Split by sentences (periods), keep continuing naturally without truncation
+    
+    # Split into sentences
+    sentences = []
+    for sentence in review_text.split('. '):
+        s = sentence.strip()
+        if s:
+            # Add period back unless it's the last sentence
+            if not s.endswith(('.', '!', '?')):
+                s += '.'
+            sentences.append(s)
+    
+    # Build posts by adding sentences until we hit the limit
+    chunks = []
+    current_chunk = ""
+    
+    for i, sentence in enumerate(sentences):
+        test_chunk = current_chunk + (" " if current_chunk else "") + sentence
         
-        for i, sentence in enumerate(sentences):
-            test_chunk = current_chunk + (" " if current_chunk else "") + sentence
-            
-            # Check if adding this sentence would exceed limit
-            if len(test_chunk) > max_length:
-                # Save current chunk and start new one
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                    current_chunk = sentence
-                    # Check if this single sentence is also too long
-                    if len(sentence) > max_length:
-                        # Split the long sentence
-                        split_at = sentence[:max_length].rfind(' ')
-                        if split_at == -1:
-                            split_at = max_length
-                        chunks[-1] = chunks[-1] if len(chunks) > 0 and len(chunks[-1]) > 0 else ""
-                        chunks.append(sentence[:split_at].strip())
-                        current_chunk = sentence[split_at:].strip()
-                else:
-                    # Single sentence too long - need to split it
+        # Check if adding this sentence would exceed limit
+        if len(test_chunk) > max_length:
+            # Save current chunk and start new one
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+                current_chunk = sentence
+                # Check if this single sentence is also too long
+                if len(sentence) > max_length:
+                    # Split the long sentence
                     split_at = sentence[:max_length].rfind(' ')
                     if split_at == -1:
                         split_at = max_length
+                    chunks[-1] = chunks[-1] if len(chunks) > 0 and len(chunks[-1]) > 0 else ""
                     chunks.append(sentence[:split_at].strip())
                     current_chunk = sentence[split_at:].strip()
             else:
-                current_chunk = test_chunk
-        
-        # Add remaining text
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        # CRITICAL: Validate ALL chunks are under max_length
-        validated_chunks = []
-        for chunk in chunks:
-            while len(chunk) > max_length:
-                # Split at sentence or word boundary
-                split_at = chunk[:max_length].rfind('. ')
-                if split_at == -1:
-                    split_at = chunk[:max_length].rfind(' ')
+                # Single sentence too long - need to split it
+                split_at = sentence[:max_length].rfind(' ')
                 if split_at == -1:
                     split_at = max_length
-                else:
-                    split_at += 1  # Include the period
-                validated_chunks.append(chunk[:split_at].strip())
-                chunk = chunk[split_at:].strip()
-            if chunk:
-                validated_chunks.append(chunk)
+                chunks.append(sentence[:split_at].strip())
+                current_chunk = sentence[split_at:].strip()
+        else:
+            current_chunk = test_chunk
+    
+    # Add remaining text
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    
+    # CRITICAL: Validate ALL chunks are under max_length
+    validated_chunks = []
+    for chunk in chunks:
+        while len(chunk) > max_length:
+            # Split at sentence or word boundary
+            split_at = chunk[:max_length].rfind('. ')
+            if split_at == -1:
+                split_at = chunk[:max_length].rfind(' ')
+            if split_at == -1:
+                split_at = max_length
+            else:
+                split_at += 1  # Include the period
+            validated_chunks.append(chunk[:split_at].strip())
+            chunk = chunk[split_at:].strip()
+        if chunk:
+            validated_chunks.append(chunk)
+    
+    chunks = validated_chunks
+    
+    # Debug: Log chunk sizes before processing
+    logging.info(f"Initial chunks: {len(chunks)} chunks")
+    for i, chunk in enumerate(chunks, 1):
+        logging.info(f"  Chunk {i}: {len(chunk)} chars")
+    
+    # Now we need exactly 3 posts:
+    # Post 1: First part of review (max 290)
+    # Post 2: Second part of review (max 290)
+    # Post 3: Final part of review + book link
+    
+    book_link = f"📚 Les mer: {book_data.get('url', '')}" if book_data else ""
+    book_link_length = len(book_link)
+    
+    if len(chunks) == 1:
+        # Single chunk - split it into parts
+        text = chunks[0]
+        # Post 1: First 290 chars at sentence boundary
+        split1 = text[:max_length].rfind('. ')
+        if split1 == -1:
+            split1 = text[:max_length].rfind(' ')
+        if split1 == -1:
+            split1 = max_length
+        else:
+            split1 += 1  # Include the period
         
-        chunks = validated_chunks
+        post1 = text[:split1].strip()
+        remaining = text[split1:].strip()
         
-        # Debug: Log chunk sizes before processing
-        logging.info(f"Initial chunks: {len(chunks)} chunks")
-        for i, chunk in enumerate(chunks, 1):
-            logging.info(f"  Chunk {i}: {len(chunk)} chars")
+        # Post 2: Next 290 chars at sentence boundary
+        if len(remaining) > 0:
+            split2 = remaining[:max_length].rfind('. ')
+            if split2 == -1:
+                split2 = remaining[:max_length].rfind(' ')
+            if split2 == -1:
+                split2 = max_length
+            else:
+                split2 += 1
+            
+            post2 = remaining[:split2].strip()
+            post3_text = remaining[split2:].strip()
+        else:
+            post2 = ""
+            post3_text = ""
         
-        # Now we need exactly 3 posts:
-        # Post 1: First part of review (max 290)
-        # Post 2: Second part of review (max 290)
-        # Post 3: Final part of review + book link
+        # Post 3: Remaining text + book link
+        if post3_text:
+            post3 = post3_text + " " + book_link
+        else:
+            post3 = book_link
         
-        book_link = f"📚 Les mer: {book_data.get('url', '')}" if book_data else ""
-        book_link_length = len(book_link)
+        chunks = [post1, post2, post3] if post2 else [post1, post3]
+    
+    elif len(chunks) == 2:
+        # Two chunks - ensure both are under limit, then add book link as post 3
+        post1 = chunks[0]
+        post2 = chunks[1]
         
-        if len(chunks) == 1:
-            # Single chunk - split it into parts
-            text = chunks[0]
-            # Post 1: First 290 chars at sentence boundary
-            split1 = text[:max_length].rfind('. ')
-            if split1 == -1:
-                split1 = text[:max_length].rfind(' ')
-            if split1 == -1:
-                split1 = max_length
-            else:
-                split1 += 1  # Include the period
-            
-            post1 = text[:split1].strip()
-            remaining = text[split1:].strip()
-            
-            # Post 2: Next 290 chars at sentence boundary
-            if len(remaining) > 0:
-                split2 = remaining[:max_length].rfind('. ')
-                if split2 == -1:
-                    split2 = remaining[:max_length].rfind(' ')
-                if split2 == -1:
-                    split2 = max_length
-                else:
-                    split2 += 1
-                
-                post2 = remaining[:split2].strip()
-                post3_text = remaining[split2:].strip()
-            else:
-                post2 = ""
-                post3_text = ""
-            
-            # Post 3: Remaining text + book link
-            if post3_text:
-                post3 = post3_text + " " + book_link
-            else:
-                post3 = book_link
-            
-            chunks = [post1, post2, post3] if post2 else [post1, post3]
+        # Ensure post1 is under limit
+        if len(post1) > max_length:
+            split_at = post1[:max_length].rfind('. ')
+            if split_at == -1:
+                split_at = post1[:max_length].rfind(' ')
+            if split_at == -1:
+                split_at = max_length
+            post1 = post1[:split_at].strip()
         
-        elif len(chunks) == 2:
-            # Two chunks - ensure both are under limit, then add book link as post 3
-            post1 = chunks[0]
-            post2 = chunks[1]
-            
-            # Ensure post1 is under limit
-            if len(post1) > max_length:
-                split_at = post1[:max_length].rfind('. ')
-                if split_at == -1:
-                    split_at = post1[:max_length].rfind(' ')
-                if split_at == -1:
-                    split_at = max_length
-                post1 = post1[:split_at].strip()
-            
-            # Ensure post2 is under limit
-            if len(post2) > max_length:
-                split_at = post2[:max_length].rfind('. ')
-                if split_at == -1:
-                    split_at = post2[:max_length].rfind(' ')
-                if split_at == -1:
-                    split_at = max_length
-                # The overflow goes to post3
-                post3_text = post2[split_at:].strip()
-                post2 = post2[:split_at].strip()
-            else:
-                post3_text = ""
-            
-            # Post 3: remaining text + book link
-            if post3_text:
-                # Ensure post3 text + link fits
-                available_space = max_length - book_link_length - 1
-                if len(post3_text) > available_space:
-                    truncate_at = post3_text[:available_space].rfind('. ')
-                    if truncate_at == -1:
-                        truncate_at = post3_text[:available_space].rfind(' ')
-                    if truncate_at == -1:
-                        truncate_at = available_space
-                    post3_text = post3_text[:truncate_at].strip()
-                post3 = post3_text + " " + book_link
-            else:
-                post3 = book_link
-            
-            chunks = [post1, post2, post3]
+        # Ensure post2 is under limit
+        if len(post2) > max_length:
+            split_at = post2[:max_length].rfind('. ')
+            if split_at == -1:
+                split_at = post2[:max_length].rfind(' ')
+            if split_at == -1:
+                split_at = max_length
+            # The overflow goes to post3
+            post3_text = post2[split_at:].strip()
+            post2 = post2[:split_at].strip()
+        else:
+            post3_text = ""
         
-        elif len(chunks) >= 3:
-            # Multiple chunks - take first two, combine rest with book link for post 3
-            post1 = chunks[0]
-            post2 = chunks[1]
-            post3_text = ' '.join(chunks[2:])
-            
-            # Ensure post 3 fits with book link
-            available_space = max_length - book_link_length - 1  # -1 for space
+        # Post 3: remaining text + book link
+        if post3_text:
+            # Ensure post3 text + link fits
+            available_space = max_length - book_link_length - 1
             if len(post3_text) > available_space:
-                # Truncate at sentence boundary
                 truncate_at = post3_text[:available_space].rfind('. ')
                 if truncate_at == -1:
                     truncate_at = post3_text[:available_space].rfind(' ')
                 if truncate_at == -1:
                     truncate_at = available_space
                 post3_text = post3_text[:truncate_at].strip()
-            
-            post3 = post3_text + " " + book_link if post3_text else book_link
-            chunks = [post1, post2, post3]
+            post3 = post3_text + " " + book_link
+        else:
+            post3 = book_link
+        
+        chunks = [post1, post2, post3]
+    
+    elif len(chunks) >= 3:
+        # Multiple chunks - take first two, combine rest with book link for post 3
+        post1 = chunks[0]
+        post2 = chunks[1]
+        post3_text = ' '.join(chunks[2:])
+        
+        # Ensure post 3 fits with book link
+        available_space = max_length - book_link_length - 1  # -1 for space
+        if len(post3_text) > available_space:
+            # Truncate at sentence boundary
+            truncate_at = post3_text[:available_space].rfind('. ')
+            if truncate_at == -1:
+                truncate_at = post3_text[:available_space].rfind(' ')
+            if truncate_at == -1:
+                truncate_at = available_space
+            post3_text = post3_text[:truncate_at].strip()
         
-        # Final logging: Show what we're about to post
-        logging.info(f"Final thread structure: {len(chunks)} posts")
-        for i, chunk in enumerate(chunks, 1):
-            logging.info(f"  Post {i}: {len(chunk)} chars")
+        post3 = post3_text + " " + book_link if post3_text else book_link
+        chunks = [post1, post2, post3]
+    
+    # Final logging: Show what we're about to post
+    logging.info(f"Final thread structure: {len(chunks)} posts")
+    for i, chunk in enumerate(chunks, 1):
+        logging.info(f"  Post {i}: {len(chunk)} chars")
+    
+    return chunks
+
+
+def post_to_bluesky(review_text, book_data=None):
+    """Post the book review to Bluesky as a thread (max 3 posts) with book cover and link. Returns post URL or None."""
+    if not BSKY_HANDLE or not BSKY_PASSWORD:
+        logging.error("Bluesky credentials not defined")
+        return None
+    
+    try:
+        client = Client()
+        client.login(BSKY_HANDLE.strip(), BSKY_PASSWORD.strip())
+        
+        with memory_stage("build thread"):
+            chunks = build_thread_chunks(review_text, book_data)
         
         logging.info(f"Creating {len(chunks)}-post thread")
         
@@ -665,6 +834,491 @@ def save_state(state):
         logging.error(f"Could not save state: {e}")
 
 
+def open_catalog(path=None):
+    """Open the book catalog, creating the tables, FTS5 index and sync triggers if needed"""
+    conn = sqlite3.connect(path or CATALOG_FILE)
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS books (
+            ean TEXT PRIMARY KEY,
+            url TEXT NOT NULL DEFAULT '',
+            source TEXT NOT NULL DEFAULT '',
+            title TEXT NOT NULL DEFAULT '',
+            author TEXT NOT NULL DEFAULT '',
+            year TEXT NOT NULL DEFAULT '',
+            language TEXT NOT NULL DEFAULT '',
+            description TEXT NOT NULL DEFAULT '',
+            reviews TEXT NOT NULL DEFAULT '',
+            image_url TEXT NOT NULL DEFAULT '',
+            reviewed INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL DEFAULT '',
+            failed_at TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS books_reviewed ON books(reviewed);
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            title, author, description, reviews,
+            content='books', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS books_ai AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts(rowid, title, author, description, reviews)
+            VALUES (new.rowid, new.title, new.author, new.description, new.reviews);
+        END;
+        CREATE TRIGGER IF NOT EXISTS books_ad AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts(books_fts, rowid, title, author, description, reviews)
+            VALUES ('delete', old.rowid, old.title, old.author, old.description, old.reviews);
+        END;
+        CREATE TRIGGER IF NOT EXISTS books_au AFTER UPDATE OF title, author, description, reviews ON books BEGIN
+            INSERT INTO books_fts(books_fts, rowid, title, author, description, reviews)
+            VALUES ('delete', old.rowid, old.title, old.author, old.description, old.reviews);
+            INSERT INTO books_fts(rowid, title, author, description, reviews)
+            VALUES (new.rowid, new.title, new.author, new.description, new.reviews);
+        END;
+    """)
+
+    # Migrate catalogs created before failed_at existed
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(books)")}
+    if 'failed_at' not in columns:
+        with conn:
+            conn.execute("ALTER TABLE books ADD COLUMN failed_at TEXT NOT NULL DEFAULT ''")
+    return conn
+
+
+def upsert_books(conn, books):
+    """Insert or update books by EAN. Empty fields never overwrite values already in the catalog,
+    so a listing-only entry (url/ean/source) does not wipe previously scraped details.
+    Storing a title clears an earlier failed detail scrape."""
+    columns = ', '.join(CATALOG_FIELDS)
+    placeholders = ', '.join('?' for _ in CATALOG_FIELDS)
+    updates = ', '.join(
+        f"{field} = COALESCE(NULLIF(excluded.{field}, ''), books.{field})"
+        for field in CATALOG_FIELDS if field != 'ean'
+    )
+    now = datetime.now(timezone.utc).isoformat()
+    rows = [
+        [book.get(field) or '' for field in CATALOG_FIELDS] + [now]
+        for book in books if book.get('ean')
+    ]
+    with conn:
+        conn.executemany(
+            f"INSERT INTO books ({columns}, updated_at) VALUES ({placeholders}, ?) "
+            f"ON CONFLICT(ean) DO UPDATE SET {updates}, updated_at = excluded.updated_at, "
+            f"failed_at = CASE WHEN excluded.title != '' THEN '' ELSE books.failed_at END",
+            rows
+        )
+    return len(rows)
+
+
+def mark_reviewed(conn, eans):
+    """Flag books as reviewed in the catalog"""
+    with conn:
+        conn.executemany("UPDATE books SET reviewed = 1 WHERE ean = ? AND reviewed = 0", [(ean,) for ean in eans])
+
+
+def mark_failed(conn, ean):
+    """Flag a book whose detail scrape failed, so selection skips it for DETAIL_RETRY_DAYS"""
+    with conn:
+        conn.execute("UPDATE books SET failed_at = ? WHERE ean = ?", (datetime.now(timezone.utc).isoformat(), ean))
+
+
+def get_catalog_book(conn, ean):
+    """Return a catalog book as a book_data dict, or None"""
+    row = conn.execute("SELECT * FROM books WHERE ean = ?", (ean,)).fetchone()
+    return dict(row) if row else None
+
+
+def search_catalog(conn, query=None, reviewed=None, min_description_length=0, limit=None, ranked=False):
+    """Query the catalog, e.g. search_catalog(conn, 'krim OR crime', reviewed=False, min_description_length=300).
+
+    query is an FTS5 match expression over title, author, description and reviews.
+    With ranked=True results are ordered by relevance, which scores every match before
+    the filters and limit apply; unranked queries can stop as soon as the limit is reached."""
+    sql = "SELECT books.* FROM books"
+    conditions, params = [], []
+    if query:
+        sql += " JOIN books_fts ON books_fts.rowid = books.rowid"
+        conditions.append("books_fts MATCH ?")
+        params.append(query)
+    if reviewed is not None:
+        conditions.append("books.reviewed = ?")
+        params.append(1 if reviewed else 0)
+    if min_description_length:
+        conditions.append("length(books.description) > ?")
+        params.append(min_description_length)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if query and ranked:
+        sql += " ORDER BY books_fts.rank"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return [dict(row) for row in conn.execute(sql, params)]
+
+
+def catalog_candidates(conn, candidates, reviewed_eans):
+    """Add scraped candidates to the catalog and return the unreviewed books to pick from.
+
+    Reviewed flags are synced after the upsert so that a reviewed EAN entering the catalog
+    for the first time is never returned. When the listing has books, only those are candidates;
+    when it came back empty, unreviewed catalog books with stored details are used instead.
+    Books whose detail scrape failed within DETAIL_RETRY_DAYS are skipped either way.
+    Books without an EAN are included anyway."""
+    upsert_books(conn, candidates)
+    mark_reviewed(conn, reviewed_eans)
+
+    retry_before = (datetime.now(timezone.utc) - timedelta(days=DETAIL_RETRY_DAYS)).isoformat()
+    sql = "SELECT * FROM books WHERE reviewed = 0 AND (failed_at = '' OR failed_at < ?)"
+    params = [retry_before]
+    listed_eans = list(dict.fromkeys(book['ean'] for book in candidates if book.get('ean')))
+    if candidates:
+        sql += f" AND ean IN ({', '.join('?' for _ in listed_eans)})"
+        params += listed_eans
+    else:
+        sql += " AND title != ''"
+
+    new_books = [dict(row) for row in conn.execute(sql, params)]
+    return new_books + [book for book in candidates if not book.get('ean')]
+
+
+_EMPTY_BIN = 1 << 64  # Larger than any 64-bit shingle hash
+
+
+def review_shingles(text):
+    """Split a review into a set of 64-bit hashed word shingles"""
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < SHINGLE_SIZE:
+        words = words + [''] * (SHINGLE_SIZE - len(words))
+    return {
+        int.from_bytes(hashlib.blake2b(' '.join(words[i:i + SHINGLE_SIZE]).encode('utf-8'), digest_size=8).digest(), 'big')
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def review_signature(text):
+    """Compute the MinHash signature of a review with one-permutation hashing.
+
+    Each shingle is hashed once and only competes for the minimum of its own bin, so the cost is
+    linear in the review length instead of shingles x bins. Empty bins borrow the value of the
+    next filled bin to the right, offset by the distance (rotation densification)."""
+    signature = [_EMPTY_BIN] * MINHASH_BINS
+    for h in review_shingles(text):
+        slot, value = h % MINHASH_BINS, h // MINHASH_BINS
+        if value < signature[slot]:
+            signature[slot] = value
+
+    bin_range = _EMPTY_BIN // MINHASH_BINS
+    for slot in range(MINHASH_BINS):
+        if signature[slot] >= _EMPTY_BIN:
+            for distance in range(1, MINHASH_BINS):
+                value = signature[(slot + distance) % MINHASH_BINS]
+                if value < bin_range:
+                    signature[slot] = value + distance * bin_range
+                    break
+    return signature
+
+
+def signature_bands(signature):
+    """Split a signature into LSH band keys"""
+    rows = MINHASH_BINS // LSH_BANDS
+    return [
+        f"{band}:" + ','.join(str(v) for v in signature[band * rows:(band + 1) * rows])
+        for band in range(LSH_BANDS)
+    ]
+
+
+def load_review_index():
+    """Load the review similarity index and rebuild its LSH buckets in memory"""
+    index = {"entries": [], "buckets": {}}
+    if REVIEW_INDEX_FILE.exists():
+        try:
+            with open(REVIEW_INDEX_FILE, 'r') as f:
+                data = json.load(f)
+            if (data.get("scheme") == REVIEW_INDEX_SCHEME and data.get("bins") == MINHASH_BINS
+                    and data.get("bands") == LSH_BANDS):
+                index["entries"] = data.get("entries", [])
+            else:
+                logging.warning("Review index was built with different MinHash settings, starting fresh")
+        except Exception as e:
+            logging.warning(f"Could not load review index: {e}")
+
+    for i, entry in enumerate(index["entries"]):
+        for key in signature_bands(entry["signature"]):
+            index["buckets"].setdefault(key, []).append(i)
+    return index
+
+
+def save_review_index(index):
+    """Save the review similarity index (buckets are derived, so only entries are stored)"""
+    try:
+        with open(REVIEW_INDEX_FILE, 'w') as f:
+            json.dump({
+                "scheme": REVIEW_INDEX_SCHEME,
+                "bins": MINHASH_BINS,
+                "bands": LSH_BANDS,
+                "entries": index["entries"]
+            }, f)
+    except Exception as e:
+        logging.error(f"Could not save review index: {e}")
+
+
+def find_similar_review(index, signature):
+    """Return (entry, estimated Jaccard similarity) of the closest indexed review, or (None, 0.0)"""
+    candidates = set()
+    for key in signature_bands(signature):
+        candidates.update(index["buckets"].get(key, ()))
+
+    best_entry, best_score = None, 0.0
+    for i in candidates:
+        entry = index["entries"][i]
+        score = sum(1 for x, y in zip(signature, entry["signature"]) if x == y) / MINHASH_BINS
+        if score > best_score:
+            best_entry, best_score = entry, score
+    return best_entry, best_score
+
+
+def add_review_to_index(index, signature, ean):
+    """Add a posted review to the index incrementally"""
+    index["entries"].append({"ean": ean, "signature": signature})
+    for key in signature_bands(signature):
+        index["buckets"].setdefault(key, []).append(len(index["entries"]) - 1)
+
+
+def generate_unique_review(book_data, index):
+    """Generate a review, regenerating while it is a near-duplicate of an earlier post.
+    Returns (review, signature) or (None, None)."""
+    best = None
+    for attempt in range(1, MAX_REVIEW_ATTEMPTS + 1):
+        review = generate_book_review(book_data)
+        if not review:
+            return None, None
+
+        signature = review_signature(review)
+        match, score = find_similar_review(index, signature)
+        if score < REVIEW_SIMILARITY_THRESHOLD:
+            return review, signature
+
+        logging.warning(f"Review attempt {attempt} is {score:.0%} similar to earlier review of EAN {match['ean']}, regenerating")
+        if best is None or score < best[2]:
+            best = (review, signature, score)
+
+    logging.warning(f"All {MAX_REVIEW_ATTEMPTS} attempts were near-duplicates, using the least similar ({best[2]:.0%})")
+    return best[0], best[1]
+
+
+def bluesky_url_to_at_uri(post_url, did_cache, client):
+    """Convert a bsky.app post URL to an AT URI, resolving the handle to a DID"""
+    match = re.match(r'https://bsky\.app/profile/([^/]+)/post/([^/?#]+)', post_url or '')
+    if not match:
+        logging.warning(f"Could not parse Bluesky post URL: {post_url}")
+        return None
+
+    actor, rkey = match.groups()
+    if not actor.startswith('did:'):
+        if actor not in did_cache:
+            did_cache[actor] = client.resolve_handle(actor).did
+        actor = did_cache[actor]
+    return f"at://{actor}/app.bsky.feed.post/{rkey}"
+
+
+def fetch_engagement_batch(client, uris):
+    """Fetch like/repost/reply/quote counts for up to 25 AT URIs in a single getPosts call"""
+    try:
+        response = client.get_posts(uris)
+    except Exception as e:
+        logging.error(f"Error fetching engagement for {len(uris)} posts: {e}")
+        return {}
+    return {
+        post.uri: [post.like_count or 0, post.repost_count or 0, post.reply_count or 0, post.quote_count or 0]
+        for post in response.posts
+    }
+
+
+def load_engagement():
+    """Load engagement time series ({ean: [[timestamp, likes, reposts, replies, quotes], ...]})"""
+    if ENGAGEMENT_FILE.exists():
+        try:
+            with open(ENGAGEMENT_FILE, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            logging.warning(f"Could not load engagement: {e}")
+    return {}
+
+
+def save_engagement(engagement):
+    """Save engagement compactly, one line per EAN, so the daily commit diff stays small"""
+    try:
+        with open(ENGAGEMENT_FILE, 'w') as f:
+            lines = [f"{json.dumps(ean)}: {json.dumps(series, separators=(',', ':'))}"
+                     for ean, series in sorted(engagement.items())]
+            f.write("{\n" + ",\n".join(lines) + "\n}\n")
+    except Exception as e:
+        logging.error(f"Could not save engagement: {e}")
+
+
+def ingest_engagement(state, engagement):
+    """Fetch engagement for all posted reviews in the state and append it to engagement as time series.
+
+    Each reviewed EAN gets a list of [timestamp, likes, reposts, replies, quotes] rows; a new row
+    is only added when the counts have changed. Returns the number of posts that got a new data point."""
+    if not BSKY_HANDLE or not BSKY_PASSWORD:
+        logging.error("Bluesky credentials not defined")
+        return 0
+
+    client = Client()
+    client.login(BSKY_HANDLE.strip(), BSKY_PASSWORD.strip())
+
+    did_cache = {}
+    uri_to_ean = {}
+    for book in state.get("reviewed_books", []):
+        try:
+            uri = bluesky_url_to_at_uri(book.get("bluesky_post"), did_cache, client)
+        except Exception as e:
+            logging.warning(f"Could not resolve post URL {book.get('bluesky_post')}: {e}")
+            continue
+        if uri:
+            uri_to_ean[uri] = book["ean"]
+
+    uris = list(uri_to_ean)
+    batches = [uris[i:i + GET_POSTS_BATCH_SIZE] for i in range(0, len(uris), GET_POSTS_BATCH_SIZE)]
+    logging.info(f"Fetching engagement for {len(uris)} posts in {len(batches)} batches")
+
+    # The batches share one logged-in client on purpose. atproto's Client serialises session
+    # refreshes behind its own lock, while separate clients would each refresh with the same
+    # single-use refresh token and invalidate one another.
+    counts = {}
+    with ThreadPoolExecutor(max_workers=ENGAGEMENT_MAX_CONCURRENCY) as executor:
+        for batch_counts in executor.map(lambda batch: fetch_engagement_batch(client, batch), batches):
+            counts.update(batch_counts)
+
+    timestamp = int(time.time())
+    updated = 0
+    for uri, values in counts.items():
+        series = engagement.setdefault(uri_to_ean[uri], [])
+        if not series or series[-1][1:] != values:
+            series.append([timestamp] + values)
+            updated += 1
+
+    logging.info(f"✅ Engagement updated for {updated} of {len(counts)} posts")
+    return updated
+
+
+@contextmanager
+def memory_stage(name):
+    """Take tracemalloc snapshots around a stage, if tracemalloc is tracing.
+
+    Only the snapshots are taken here; comparing them is left to run_profiled() after the
+    profiler stops, so the diffing does not show up in the profile."""
+    if not tracemalloc.is_tracing():
+        yield
+        return
+
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    try:
+        yield
+    finally:
+        peak = tracemalloc.get_traced_memory()[1]
+        MEMORY_SNAPSHOTS.append((name, before, tracemalloc.take_snapshot(), peak))
+
+
+def memory_stage_diff(before, after, top=10):
+    """Largest allocation differences between two snapshots, excluding tracemalloc itself"""
+    return after.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).compare_to(before, 'lineno')[:top]
+
+
+def sample_stacks(thread_id, stop_event, counts):
+    """Sample the call stack of a thread until stop_event is set, counting collapsed stacks"""
+    while not stop_event.wait(PROFILE_SAMPLE_INTERVAL):
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            key = ';'.join(reversed(stack))
+            counts[key] = counts.get(key, 0) + 1
+
+
+def run_profiled(func, profile_dir=PROFILE_DIR):
+    """Run func under cProfile and tracemalloc, and write the results to profile_dir:
+    bot.prof (cProfile stats), bot_stats.txt (top functions) and memory.txt (tracemalloc diffs per stage)"""
+    profile_dir = Path(profile_dir)
+    profile_dir.mkdir(parents=True, exist_ok=True)
+
+    profiler = cProfile.Profile()
+
+    MEMORY_SNAPSHOTS.clear()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        return func()
+    finally:
+        profiler.disable()
+        tracemalloc.stop()
+
+        profiler.dump_stats(profile_dir / "bot.prof")
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(40)
+        (profile_dir / "bot_stats.txt").write_text(stream.getvalue(), encoding='utf-8')
+
+        with open(profile_dir / "memory.txt", 'w', encoding='utf-8') as f:
+            for name, before, after, peak in MEMORY_SNAPSHOTS:
+                f.write(f"=== {name} (peak {peak / 1024:.1f} KiB)\n")
+                for stat in memory_stage_diff(before, after):
+                    f.write(f"{stat}\n")
+                f.write("\n")
+
+        logging.info(f"📊 cProfile stats and {len(MEMORY_SNAPSHOTS)} memory stages written to {profile_dir}/")
+
+
+def run_sampled(func, profile_dir=PROFILE_DIR, min_duration=0):
+    """Run func under the stack sampler only and write bot.collapsed (collapsed stacks for
+    flamegraph.pl or speedscope) to profile_dir. cProfile and tracemalloc stay off so their
+    overhead does not skew the flame graph. func is repeated until min_duration seconds have
+    passed, so short offline stages still collect enough samples."""
+    profile_dir = Path(profile_dir)
+    profile_dir.mkdir(parents=True, exist_ok=True)
+
+    counts = {}
+    stop_event = threading.Event()
+    sampler = threading.Thread(target=sample_stacks, args=(threading.get_ident(), stop_event, counts), daemon=True)
+
+    passes = 0
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        while True:
+            result = func()
+            passes += 1
+            if time.perf_counter() - started >= min_duration:
+                return result
+    finally:
+        stop_event.set()
+        sampler.join()
+
+        with open(profile_dir / "bot.collapsed", 'w', encoding='utf-8') as f:
+            for stack, count in sorted(counts.items()):
+                f.write(f"{stack} {count}\n")
+
+        logging.info(f"📊 {sum(counts.values())} stack samples from {passes} passes written to {profile_dir}/bot.collapsed")
+
+
+def run_replay_stages():
+    """Run the parsing and thread building stages against replayed pages, without state or services"""
+    candidates = scrape_book_list()
+    for candidate in candidates:
+        if not page_file(REPLAY_DIR, candidate['url']).exists():
+            continue
+        book_data = scrape_book_details(candidate['url'], candidate['source'])
+        if not book_data:
+            continue
+        # No review is generated offline, so the description stands in for the review text
+        with memory_stage("build thread"):
+            build_thread_chunks(book_data['description'] or book_data['title'], book_data)
+
+
 def main():
     logging.info("🎭 Starting Norli Book Daddy Bot")
     
@@ -677,48 +1331,55 @@ def main():
     logging.info(f"Previously reviewed: {len(reviewed_eans)} books (by EAN)")
     logging.info(f"All-time stats: {stats['total_reviews']} reviews generated, {stats['total_posted']} posted")
     
-    # Get list of books
-    book_urls = scrape_book_list()
+    # Get list of books from all sources
+    candidates = scrape_book_list()
     
-    if not book_urls:
-        logging.error("No books found on the monthly new books page!")
-        logging.info("Canceling run - no books available")
-        exit(78)  # Exit code 78 means "no new books to review"
+    if not candidates:
+        logging.warning("No books found on the monthly new books page, using catalog only")
     
-    # Extract EANs from URLs and filter out already reviewed books
-    import re
-    new_books = []
-    for url in book_urls:
-        ean_match = re.search(r'-(978\d{10})(?:\?|$)', url)
-        if ean_match:
-            ean = ean_match.group(1)
-            if ean not in reviewed_eans:
-                new_books.append(url)
-        else:
-            # If we can't extract EAN, include it anyway
-            new_books.append(url)
+    # Unreviewed books come from the catalog
+    catalog = open_catalog()
+    new_books = catalog_candidates(catalog, candidates, reviewed_eans)
     
     if not new_books:
-        logging.info("🛑 No new books to review! All books on the page have been reviewed.")
+        logging.info("🛑 No new books to review! Every candidate in the listing (or, without a listing, "
+                     "in the catalog) is already reviewed or recently failed to scrape.")
         logging.info("Canceling GitHub Action run - no new books available")
         exit(78)  # Exit code 78 means "no new books to review"
     
     logging.info(f"Found {len(new_books)} new books to review (not yet reviewed by EAN)")
     
-    # Pick a random book
-    selected_url = random.choice(new_books)
-    logging.info(f"📚 Selected: {selected_url}")
-    
-    # Scrape book details
-    book_data = scrape_book_details(selected_url)
+    # Pick random books until one has usable details
+    random.shuffle(new_books)
+    book_data = None
+    for selected in new_books[:MAX_DETAIL_ATTEMPTS]:
+        selected_url = selected['url']
+        logging.info(f"📚 Selected: {selected_url} ({selected['source']})")
+        
+        # Use catalog details if we have them, otherwise scrape and store them
+        if selected.get('title'):
+            logging.info("Using book details from catalog")
+            book_data = selected
+            break
+        
+        book_data = scrape_book_details(selected_url, selected['source'])
+        if book_data and book_data['title']:
+            upsert_books(catalog, [book_data])
+            break
+        
+        logging.warning(f"Could not extract book details for {selected_url}, trying another book")
+        if selected.get('ean'):
+            mark_failed(catalog, selected['ean'])
+        book_data = None
     
-    if not book_data or not book_data['title']:
+    if not book_data:
         logging.error("Could not extract book details!")
         return
     
-    # Generate review
-    review = generate_book_review(book_data)
-    
+    # Generate review, checking it against earlier posts for near-duplicates
+    review_index = load_review_index()
+    review, signature = generate_unique_review(book_data, review_index)
+
     if not review:
         logging.error("Could not generate review!")
         return
@@ -738,6 +1399,7 @@ def main():
             "title": book_data['title'],
             "author": book_data['author'],
             "norli_url": selected_url,
+            "source": book_data['source'],
             "bluesky_post": post_url,
             "reviewed_at": datetime.now(timezone.utc).isoformat()
         }
@@ -748,7 +1410,11 @@ def main():
         state['reviewed_books'] = reviewed_books
         state['stats'] = stats
         save_state(state)
-        
+
+        mark_reviewed(catalog, [book_data['ean']])
+        add_review_to_index(review_index, signature, book_data['ean'])
+        save_review_index(review_index)
+
         logging.info("✅ Success! Book review posted to Bluesky")
         logging.info(f"📝 Tracked EAN: {book_data['ean']}")
         logging.info(f"🔗 Bluesky post: {post_url}")
@@ -764,4 +1430,48 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Norli Book Daddy Bot")
+    parser.add_argument('--ingest-engagement', action='store_true',
+                        help="Fetch likes/reposts/replies for posted reviews instead of posting a new one")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile the run and write cProfile stats, collapsed stacks and memory snapshots")
+    parser.add_argument('--profile-mode', choices=['deterministic', 'sampling', 'both'],
+                        help="deterministic: cProfile + tracemalloc; sampling: stack samples for a flame graph; "
+                             "both: one separate pass each (default: both with --replay, deterministic otherwise)")
+    parser.add_argument('--profile-dir', type=Path, default=PROFILE_DIR,
+                        help="Directory for profiling output (default: profile/)")
+    parser.add_argument('--record', type=Path, metavar='DIR',
+                        help="Save every fetched page to DIR for later replay")
+    parser.add_argument('--replay', type=Path, metavar='DIR',
+                        help="Read pages from DIR instead of the browser and run only the parsing and "
+                             "thread building stages, without GPT-4o, Bluesky, state or catalog")
+    args = parser.parse_args()
+
+    profile_mode = args.profile_mode or ('both' if args.replay else 'deterministic')
+    if args.profile_mode and not args.profile:
+        parser.error("--profile-mode requires --profile")
+    if args.profile and profile_mode == 'both' and not args.replay:
+        parser.error("--profile-mode both needs --replay: a live run cannot be repeated for a second pass")
+    if args.replay and args.ingest_engagement:
+        parser.error("--replay cannot be combined with --ingest-engagement")
+
+    REPLAY_DIR = args.replay
+    RECORD_DIR = args.record
+    if RECORD_DIR:
+        RECORD_DIR.mkdir(parents=True, exist_ok=True)
+
+    run = run_replay_stages if REPLAY_DIR else main
+    try:
+        if args.ingest_engagement:
+            engagement = load_engagement()
+            ingest_engagement(load_state(), engagement)
+            save_engagement(engagement)
+        elif args.profile:
+            if profile_mode in ('deterministic', 'both'):
+                run_profiled(run, args.profile_dir)
+            if profile_mode in ('sampling', 'both'):
+                run_sampled(run, args.profile_dir, PROFILE_REPLAY_MIN_SECONDS if REPLAY_DIR else 0)
+        else:
+            run()
+    finally:
+        close_shared_driver()
@@ -0,0 +1,136 @@
+import sqlite3
+
+import pytest
+
+import main
+from main import (catalog_candidates, get_catalog_book, mark_failed, mark_reviewed, open_catalog, search_catalog,
+                  upsert_books)
+
+
+def listing(*eans):
+    return [{'url': f"https://www.norli.no/boker/bok-{ean}", 'ean': ean, 'source': 'norli'} for ean in eans]
+
+
+def book(ean, **fields):
+    return dict({'ean': ean, 'url': f"https://www.norli.no/boker/bok-{ean}", 'source': 'norli'}, **fields)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    conn = open_catalog(tmp_path / "catalog.db")
+    yield conn
+    conn.close()
+
+
+def eans(books):
+    return sorted(b['ean'] for b in books)
+
+
+def test_reviewed_ean_entering_catalog_is_not_a_candidate(catalog):
+    new_books = catalog_candidates(catalog, listing('9788202806453', '9788205623170'), {'9788202806453'})
+
+    assert eans(new_books) == ['9788205623170']
+
+
+def test_posted_books_are_never_candidates(catalog):
+    reviewed_books = [
+        {"ean": "9788202896188", "title": "Det gode mennesket i Sandvika", "author": "Vigdis Hjorth"},
+        {"ean": "9788205623170", "title": "1899 - preludium", "author": "Gunnar Staalesen"},
+    ]
+    reviewed_eans = {b["ean"] for b in reviewed_books}
+
+    assert catalog_candidates(catalog, listing(*reviewed_eans), reviewed_eans) == []
+    assert search_catalog(catalog, reviewed=False) == []
+
+
+def test_books_without_ean_are_kept(catalog):
+    candidates = [{'url': 'https://www.norli.no/boker/no-ean', 'ean': '', 'source': 'norli'}]
+
+    assert catalog_candidates(catalog, candidates, set()) == candidates
+
+
+def test_books_no_longer_listed_are_not_candidates(catalog):
+    catalog_candidates(catalog, listing('9780000000001', '9780000000002'), set())
+
+    assert eans(catalog_candidates(catalog, listing('9780000000002'), set())) == ['9780000000002']
+
+
+def test_empty_listing_falls_back_to_catalog_books_with_details(catalog):
+    upsert_books(catalog, [book('9780000000001', title='Med detaljer'), book('9780000000002')])
+
+    assert eans(catalog_candidates(catalog, [], set())) == ['9780000000001']
+
+
+def test_failed_detail_scrape_is_skipped_until_retry(catalog, monkeypatch):
+    catalog_candidates(catalog, listing('9780000000001', '9780000000002'), set())
+    mark_failed(catalog, '9780000000001')
+
+    assert eans(catalog_candidates(catalog, listing('9780000000001', '9780000000002'), set())) == ['9780000000002']
+
+    monkeypatch.setattr(main, "DETAIL_RETRY_DAYS", -1)
+    assert eans(catalog_candidates(catalog, listing('9780000000001', '9780000000002'), set())) == [
+        '9780000000001', '9780000000002']
+
+
+def test_stored_details_clear_failure(catalog):
+    upsert_books(catalog, [book('9780000000001')])
+    mark_failed(catalog, '9780000000001')
+
+    upsert_books(catalog, [book('9780000000001', title='Endelig')])
+
+    assert get_catalog_book(catalog, '9780000000001')['failed_at'] == ''
+
+
+def test_empty_fields_do_not_overwrite_stored_details(catalog):
+    upsert_books(catalog, [book('9780000000001', title='Krim i Bergen', author='Forfatter', description='Regn')])
+
+    upsert_books(catalog, [book('9780000000001', url='https://www.norli.no/boker/ny-url')])
+
+    stored = get_catalog_book(catalog, '9780000000001')
+    assert stored['title'] == 'Krim i Bergen'
+    assert stored['author'] == 'Forfatter'
+    assert stored['description'] == 'Regn'
+    assert stored['url'] == 'https://www.norli.no/boker/ny-url'
+
+
+def test_fts_follows_updates(catalog):
+    upsert_books(catalog, [book('9780000000001', title='Krim i Bergen')])
+    upsert_books(catalog, [book('9780000000001', title='Kjærlighet i Oslo')])
+
+    assert search_catalog(catalog, 'krim') == []
+    assert eans(search_catalog(catalog, 'kjærlighet')) == ['9780000000001']
+    assert eans(search_catalog(catalog, 'kjaerlighet')) == []
+    assert eans(search_catalog(catalog, 'title:oslo')) == ['9780000000001']
+
+
+def test_search_filters(catalog):
+    upsert_books(catalog, [
+        book('9780000000001', title='Krim', description='x' * 301),
+        book('9780000000002', title='Krim', description='x' * 300),
+        book('9780000000003', title='Krim', description='x' * 500),
+        book('9780000000004', title='Roman', description='x' * 500),
+    ])
+    mark_reviewed(catalog, ['9780000000003'])
+
+    assert eans(search_catalog(catalog, 'krim', reviewed=False, min_description_length=300)) == ['9780000000001']
+    assert eans(search_catalog(catalog, 'krim', reviewed=True)) == ['9780000000003']
+    assert eans(search_catalog(catalog, min_description_length=300)) == [
+        '9780000000001', '9780000000003', '9780000000004']
+    assert len(search_catalog(catalog, 'krim', limit=2)) == 2
+    assert len(search_catalog(catalog, 'krim', ranked=True)) == 3
+
+
+def test_old_catalog_is_migrated(tmp_path):
+    path = tmp_path / "catalog.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE books (ean TEXT PRIMARY KEY, url TEXT NOT NULL DEFAULT '', source TEXT NOT NULL DEFAULT '', "
+                 "title TEXT NOT NULL DEFAULT '', author TEXT NOT NULL DEFAULT '', year TEXT NOT NULL DEFAULT '', "
+                 "language TEXT NOT NULL DEFAULT '', description TEXT NOT NULL DEFAULT '', "
+                 "reviews TEXT NOT NULL DEFAULT '', image_url TEXT NOT NULL DEFAULT '', "
+                 "reviewed INTEGER NOT NULL DEFAULT 0, updated_at TEXT NOT NULL DEFAULT '')")
+    conn.close()
+
+    catalog = open_catalog(path)
+    mark_failed(catalog, '9780000000001')
+    assert 'failed_at' in {row['name'] for row in catalog.execute("PRAGMA table_info(books)")}
+    catalog.close()
@@ -0,0 +1,160 @@
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from main import (bluesky_url_to_at_uri, fetch_engagement_batch, ingest_engagement, load_engagement,
+                  save_engagement)
+
+DID = "did:plc:norlidaddy"
+
+
+class FakeClient:
+    """Fake atproto client serving resolveHandle and getPosts from an in-memory table"""
+
+    def __init__(self):
+        self.counts = {}
+        self.failing_uris = set()
+        self.resolved = []
+        self.get_posts_calls = []
+
+    def login(self, handle, password):
+        pass
+
+    def resolve_handle(self, handle):
+        self.resolved.append(handle)
+        return SimpleNamespace(did=DID)
+
+    def get_posts(self, uris):
+        self.get_posts_calls.append(list(uris))
+        if self.failing_uris.intersection(uris):
+            raise RuntimeError("upstream error")
+        posts = []
+        for uri in uris:
+            likes, reposts, replies, quotes = self.counts.get(uri, [0, 0, 0, 0])
+            posts.append(SimpleNamespace(uri=uri, like_count=likes, repost_count=reposts,
+                                         reply_count=replies, quote_count=quotes))
+        return SimpleNamespace(posts=posts)
+
+
+def post_url(rkey, handle="norlidaddy.bsky.social"):
+    return f"https://bsky.app/profile/{handle}/post/{rkey}"
+
+
+def make_state(count):
+    return {"reviewed_books": [
+        {"ean": f"978{i:010d}", "bluesky_post": post_url(f"rkey{i}")} for i in range(count)
+    ]}
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(main, "Client", lambda: client)
+    monkeypatch.setattr(main, "BSKY_HANDLE", "norlidaddy.bsky.social")
+    monkeypatch.setattr(main, "BSKY_PASSWORD", "secret")
+    return client
+
+
+def test_url_to_at_uri_caches_handle_resolution():
+    client = FakeClient()
+    did_cache = {}
+
+    first = bluesky_url_to_at_uri(post_url("abc"), did_cache, client)
+    second = bluesky_url_to_at_uri(post_url("def"), did_cache, client)
+
+    assert first == f"at://{DID}/app.bsky.feed.post/abc"
+    assert second == f"at://{DID}/app.bsky.feed.post/def"
+    assert client.resolved == ["norlidaddy.bsky.social"]
+
+
+def test_url_to_at_uri_keeps_did_without_resolving():
+    client = FakeClient()
+
+    uri = bluesky_url_to_at_uri(post_url("abc", handle="did:plc:other"), {}, client)
+
+    assert uri == "at://did:plc:other/app.bsky.feed.post/abc"
+    assert client.resolved == []
+
+
+def test_url_to_at_uri_rejects_malformed_url():
+    assert bluesky_url_to_at_uri("https://example.com/not-a-post", {}, FakeClient()) is None
+    assert bluesky_url_to_at_uri(None, {}, FakeClient()) is None
+
+
+def test_fetch_engagement_batch_failure_returns_empty():
+    client = FakeClient()
+    client.failing_uris = {"at://x/app.bsky.feed.post/1"}
+
+    assert fetch_engagement_batch(client, ["at://x/app.bsky.feed.post/1"]) == {}
+
+
+def test_ingest_batches_at_most_25_uris(fake_client):
+    state = make_state(26)
+
+    assert ingest_engagement(state, {}) == 26
+    assert sorted(len(call) for call in fake_client.get_posts_calls) == [1, 25]
+    assert fake_client.resolved == ["norlidaddy.bsky.social"]
+
+
+def test_ingest_skips_malformed_url(fake_client):
+    state = make_state(2)
+    state["reviewed_books"].append({"ean": "9780000000099", "bluesky_post": "not a url"})
+
+    engagement = {}
+
+    assert ingest_engagement(state, engagement) == 2
+    assert "9780000000099" not in engagement
+
+
+def test_ingest_skips_failed_batch(fake_client):
+    fake_client.failing_uris = {f"at://{DID}/app.bsky.feed.post/rkey0"}
+    state = make_state(30)
+
+    engagement = {}
+
+    # The first batch of 25 fails, the second batch of 5 is still stored
+    assert ingest_engagement(state, engagement) == 5
+    assert sorted(engagement) == [book["ean"] for book in state["reviewed_books"][25:]]
+
+
+def test_ingest_appends_row_only_when_counts_change(fake_client):
+    state = make_state(2)
+    first_uri = f"at://{DID}/app.bsky.feed.post/rkey0"
+    first_ean = state["reviewed_books"][0]["ean"]
+    engagement = {}
+
+    fake_client.counts[first_uri] = [1, 0, 0, 0]
+    assert ingest_engagement(state, engagement) == 2
+    assert ingest_engagement(state, engagement) == 0
+
+    fake_client.counts[first_uri] = [3, 1, 0, 0]
+    assert ingest_engagement(state, engagement) == 1
+
+    series = engagement[first_ean]
+    assert [row[1:] for row in series] == [[1, 0, 0, 0], [3, 1, 0, 0]]
+    assert len(engagement[state["reviewed_books"][1]["ean"]]) == 1
+
+
+def test_engagement_file_is_one_line_per_ean(tmp_path, monkeypatch):
+    path = tmp_path / "engagement.json"
+    monkeypatch.setattr(main, "ENGAGEMENT_FILE", path)
+    engagement = {"9780000000002": [[1, 2, 0, 0, 0]], "9780000000001": [[1, 5, 1, 0, 0], [2, 6, 1, 1, 0]]}
+
+    save_engagement(engagement)
+
+    assert path.read_text().splitlines() == [
+        '{',
+        '"9780000000001": [[1,5,1,0,0],[2,6,1,1,0]],',
+        '"9780000000002": [[1,2,0,0,0]]',
+        '}',
+    ]
+    assert load_engagement() == engagement
+
+
+def test_empty_engagement_round_trips(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ENGAGEMENT_FILE", tmp_path / "engagement.json")
+
+    assert load_engagement() == {}
+    save_engagement({})
+    assert load_engagement() == {}
@@ -0,0 +1,121 @@
+import pytest
+
+import main
+from main import close_shared_driver, fetch_pages, scrape_book_details, scrape_book_list
+
+
+class FakeDriver:
+    """Fake Selenium driver with tabs; URLs in fail_urls raise on load"""
+
+    def __init__(self, fail_urls=()):
+        self.fail_urls = set(fail_urls)
+        self.tabs = {"tab0": None}
+        self.current_window_handle = "tab0"
+        self.loads = []
+        self.opened = 0
+        self.switch_to = self
+        self.quit_called = False
+
+    @property
+    def window_handles(self):
+        return list(self.tabs)
+
+    def new_window(self, kind):
+        self.opened += 1
+        handle = f"tab{self.opened}"
+        self.tabs[handle] = None
+        self.current_window_handle = handle
+
+    def window(self, handle):
+        self.current_window_handle = handle
+
+    def get(self, url):
+        self.loads.append(url)
+        if url in self.fail_urls:
+            raise RuntimeError("timeout")
+        self.tabs[self.current_window_handle] = url
+
+    @property
+    def page_source(self):
+        return f"<p>{self.tabs[self.current_window_handle]}</p>"
+
+    def close(self):
+        del self.tabs[self.current_window_handle]
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    driver = FakeDriver(fail_urls={"https://b"})
+    started = []
+    monkeypatch.setattr(main, "get_selenium_driver", lambda: started.append(driver) or driver)
+    driver.started = started
+    monkeypatch.setattr(main.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(main, "FETCH_MAX_TABS", 3)
+    yield driver
+    close_shared_driver()
+
+
+def test_failed_load_is_skipped_and_its_tab_closed(driver):
+    pages = fetch_pages(["https://a", "https://b", "https://c", "https://d"])
+
+    assert sorted(pages) == ["https://a", "https://c", "https://d"]
+    assert pages["https://c"].get_text() == "https://c"
+    assert driver.window_handles == ["tab0"]
+    assert not driver.quit_called
+
+    close_shared_driver()
+    assert driver.quit_called
+
+
+def test_duplicate_urls_are_loaded_once(driver):
+    pages = fetch_pages(["https://a", "https://a", "https://c"])
+
+    assert driver.loads == ["https://a", "https://c"]
+    assert sorted(pages) == ["https://a", "https://c"]
+    assert driver.window_handles == ["tab0"]
+
+
+def test_list_and_detail_fetches_share_one_browser(driver):
+    fetch_pages(["https://a", "https://c"])
+    fetch_pages(["https://d"])
+
+    assert len(driver.started) == 1
+    assert driver.loads == ["https://a", "https://c", "https://d"]
+
+
+def list_adapter(name, list_url, links):
+    return {
+        'name': name,
+        'list_urls': [list_url],
+        'extract_book_links': lambda soup: links,
+        'extract_book_details': lambda soup, book_data: book_data.update(title=f"{name} title"),
+        'extract_ean': lambda url: url.rsplit('-', 1)[-1] if '-978' in url else '',
+    }
+
+
+def test_book_list_is_merged_and_deduplicated_by_ean(monkeypatch):
+    fetched = []
+    monkeypatch.setattr(main, "fetch_pages", lambda urls: fetched.append(list(urls)) or {url: url for url in urls})
+    first = list_adapter("first", "https://first/list", [
+        "https://first/bok-9780000000001", "https://first/bok-9780000000002", "https://first/uten-ean"])
+    second = list_adapter("second", "https://second/list", [
+        "https://second/bok-9780000000002", "https://second/bok-9780000000003", "https://second/uten-ean"])
+    monkeypatch.setattr(main, "SOURCE_ADAPTERS", [first, second])
+
+    candidates = scrape_book_list()
+
+    assert fetched == [["https://first/list", "https://second/list"]]
+    assert [(book['ean'], book['source']) for book in candidates] == [
+        ("9780000000001", "first"),
+        ("9780000000002", "first"),
+        ("", "first"),
+        ("9780000000003", "second"),
+        ("", "second"),
+    ]
+
+    details = scrape_book_details("https://second/bok-9780000000003", "second")
+    assert details['title'] == "second title"
+    assert details['source'] == "second"
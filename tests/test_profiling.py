@@ -0,0 +1,110 @@
+import pstats
+import tracemalloc
+
+import pytest
+
+import main
+from main import fetch_pages, memory_stage, memory_stage_diff, page_file, run_profiled, run_replay_stages, run_sampled
+
+LIST_URL = main.NORLI_NEW_BOOKS_URL
+BOOK_URLS = [f"https://www.norli.no/boker/romaner/bok-{i}-978820280640{i}" for i in range(3)]
+
+
+@pytest.fixture
+def replay_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "pages"
+    directory.mkdir()
+    page_file(directory, LIST_URL).write_text(
+        ''.join(f'<a href="{url.removeprefix("https://www.norli.no")}">Bok</a>' for url in BOOK_URLS), encoding='utf-8')
+    for i, url in enumerate(BOOK_URLS):
+        page_file(directory, url).write_text(
+            f'<h1>Tittel {i}</h1><section class="descriptionWrapper-x"><div class="richText-y"><p>'
+            + 'Dette er en setning. ' * 40 + '</p></div></section>', encoding='utf-8')
+    monkeypatch.setattr(main, "REPLAY_DIR", directory)
+    return directory
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    main.MEMORY_SNAPSHOTS.clear()
+    yield
+    main.MEMORY_SNAPSHOTS.clear()
+
+
+def test_page_file_is_stable_and_filesystem_safe(tmp_path):
+    path = page_file(tmp_path, "https://www.norli.no/boker/a?b=1&c=2")
+
+    assert path == page_file(tmp_path, "https://www.norli.no/boker/a?b=1&c=2")
+    assert path.parent == tmp_path
+    assert path.name == "https_www_norli_no_boker_a_b_1_c_2.html"
+
+
+def test_recorded_page_replays(tmp_path, monkeypatch):
+    from test_fetch_pages import FakeDriver
+
+    driver = FakeDriver()
+    monkeypatch.setattr(main, "get_selenium_driver", lambda: driver)
+    monkeypatch.setattr(main.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(main, "RECORD_DIR", tmp_path)
+    recorded = fetch_pages(["https://a"])
+    main.close_shared_driver()
+
+    monkeypatch.setattr(main, "RECORD_DIR", None)
+    monkeypatch.setattr(main, "REPLAY_DIR", tmp_path)
+    replayed = fetch_pages(["https://a", "https://missing"])
+
+    assert list(replayed) == ["https://a"]
+    assert replayed["https://a"].get_text() == recorded["https://a"].get_text() == "https://a"
+
+
+def test_memory_stage_is_a_no_op_without_tracemalloc():
+    assert not tracemalloc.is_tracing()
+
+    with memory_stage("parse"):
+        data = [0] * 1000
+
+    assert main.MEMORY_SNAPSHOTS == []
+
+
+def test_memory_stage_records_diff_with_tracemalloc():
+    tracemalloc.start()
+    try:
+        with memory_stage("parse"):
+            data = [str(i) for i in range(10000)]
+    finally:
+        tracemalloc.stop()
+
+    [(name, before, after, peak)] = main.MEMORY_SNAPSHOTS
+    assert name == "parse"
+    assert peak > 0
+    assert memory_stage_diff(before, after)[0].size_diff > 0
+    assert len(data) == 10000
+
+
+def test_run_profiled_writes_stats_and_memory(replay_dir, tmp_path):
+    out = tmp_path / "profile"
+
+    run_profiled(run_replay_stages, out)
+
+    assert pstats.Stats(str(out / "bot.prof")).total_calls > 0
+    assert "run_replay_stages" in (out / "bot_stats.txt").read_text()
+    memory = (out / "memory.txt").read_text()
+    assert f"=== parse {BOOK_URLS[0]}" in memory
+    assert "=== build thread" in memory
+    assert not tracemalloc.is_tracing()
+
+
+def test_run_sampled_repeats_until_min_duration(replay_dir, tmp_path):
+    out = tmp_path / "profile"
+    calls = []
+
+    run_sampled(lambda: calls.append(run_replay_stages()), out, min_duration=0.3)
+
+    lines = (out / "bot.collapsed").read_text().splitlines()
+    assert len(calls) > 1
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert int(count) > 0
+    assert any("run_replay_stages" in line for line in lines)
+    assert not (out / "bot.prof").exists()
@@ -0,0 +1,115 @@
+import json
+import random
+
+import pytest
+
+import main
+from main import (add_review_to_index, find_similar_review, generate_unique_review, load_review_index,
+                  review_shingles, review_signature, save_review_index)
+
+BOOK = {'title': 'Tittel', 'author': 'Forfatter', 'year': '2025', 'language': 'Norwegian',
+        'description': '', 'reviews': '', 'ean': '9788202806453'}
+
+
+def make_review(seed, words=180):
+    rng = random.Random(seed)
+    return ' '.join(f"ord{rng.randrange(800)}" for _ in range(words))
+
+
+def jaccard(a, b):
+    x, y = review_shingles(a), review_shingles(b)
+    return len(x & y) / len(x | y)
+
+
+@pytest.fixture
+def index_file(tmp_path, monkeypatch):
+    path = tmp_path / "review_index.json"
+    monkeypatch.setattr(main, "REVIEW_INDEX_FILE", path)
+    return path
+
+
+def test_shingles_are_case_and_punctuation_insensitive():
+    assert review_shingles("Å, for en bok!") == review_shingles("å for EN bok")
+    assert len(review_shingles("en to tre fire")) == 2
+
+
+def test_short_review_still_has_a_shingle():
+    assert len(review_shingles("hei")) == 1
+    assert len(review_signature("hei")) == main.MINHASH_BINS
+
+
+def test_signature_is_deterministic_and_tracks_jaccard():
+    base = make_review(1)
+    words = base.split()
+    variant = ' '.join(words[:120] + make_review(2, 60).split())
+
+    assert review_signature(base) == review_signature(base)
+    estimate = sum(x == y for x, y in zip(review_signature(base), review_signature(variant))) / main.MINHASH_BINS
+    assert abs(estimate - jaccard(base, variant)) < 0.2
+
+
+def test_similar_review_is_found_and_different_one_is_not():
+    index = {"entries": [], "buckets": {}}
+    base = make_review(1)
+    add_review_to_index(index, review_signature(base), "111")
+
+    near = base.replace(base.split()[5], "annet", 1)
+    entry, score = find_similar_review(index, review_signature(near))
+    assert entry["ean"] == "111"
+    assert score > main.REVIEW_SIMILARITY_THRESHOLD
+
+    assert find_similar_review(index, review_signature(make_review(99))) == (None, 0.0)
+
+
+def test_index_round_trips_and_updates_incrementally(index_file):
+    index = load_review_index()
+    add_review_to_index(index, review_signature(make_review(1)), "111")
+    save_review_index(index)
+
+    index = load_review_index()
+    add_review_to_index(index, review_signature(make_review(2)), "222")
+    save_review_index(index)
+
+    reloaded = load_review_index()
+    assert [entry["ean"] for entry in reloaded["entries"]] == ["111", "222"]
+    assert find_similar_review(reloaded, review_signature(make_review(2)))[0]["ean"] == "222"
+
+
+def test_index_with_other_settings_starts_fresh(index_file):
+    index_file.write_text(json.dumps({"num_perm": 64, "bands": 16, "entries": [{"ean": "1", "signature": [1] * 64}]}))
+
+    assert load_review_index() == {"entries": [], "buckets": {}}
+
+
+def test_regenerates_near_duplicate_review(monkeypatch):
+    index = {"entries": [], "buckets": {}}
+    old = make_review(1)
+    add_review_to_index(index, review_signature(old), "111")
+    reviews = iter([old, make_review(2)])
+    monkeypatch.setattr(main, "generate_book_review", lambda book_data: next(reviews))
+
+    review, signature = generate_unique_review(BOOK, index)
+
+    assert review == make_review(2)
+    assert signature == review_signature(review)
+
+
+def test_falls_back_to_least_similar_review(monkeypatch):
+    index = {"entries": [], "buckets": {}}
+    old = make_review(1)
+    add_review_to_index(index, review_signature(old), "111")
+    words = old.split()
+    slightly_changed = ' '.join(words[:150] + make_review(3, 30).split())
+    assert jaccard(old, slightly_changed) > main.REVIEW_SIMILARITY_THRESHOLD
+    reviews = iter([old, slightly_changed, old])
+    monkeypatch.setattr(main, "generate_book_review", lambda book_data: next(reviews))
+
+    review, _ = generate_unique_review(BOOK, index)
+
+    assert review == slightly_changed
+
+
+def test_generation_failure_returns_none(monkeypatch):
+    monkeypatch.setattr(main, "generate_book_review", lambda book_data: None)
+
+    assert generate_unique_review(BOOK, {"entries": [], "buckets": {}}) == (None, None)